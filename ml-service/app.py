@@ -1,19 +1,35 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
 import cv2
 import numpy as np
 import tensorflow as tf
-from PIL import Image
-import io
 import base64
 import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 import redis
-import json
+import orjson
 import os
-from datetime import datetime
+import atexit
+import collections
+import hashlib
+import queue
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
 import logging
 from dotenv import load_dotenv
 
+# TensorRT is optional and only used on GPU deployments (see requirements-gpu.txt)
+try:
+    import tensorrt as trt
+    import pycuda.driver as cuda
+except ImportError:
+    trt = None
+    cuda = None
+
 # Load environment variables
 load_dotenv()
 
@@ -26,17 +42,100 @@ CORS(app)
 
 # Global variables
 emotion_model = None
-face_cascade = None
-emotion_labels = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+emotion_infer = None
+trt_engine = None
+tflite_interpreter = None
+emotion_pipeline = None
+emotion_labels = ('angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral')
+NUM_EMOTIONS = len(emotion_labels)
+
+# Shared random generator for the demonstration fallback
+RNG = np.random.default_rng()
+
+# Define emotion weights (higher = more engaged)
+emotion_weights = {
+    'happy': 0.9,
+    'surprise': 0.8,
+    'neutral': 0.7,
+    'fear': 0.4,
+    'sad': 0.3,
+    'angry': 0.2,
+    'disgust': 0.1
+}
+
+# Emotion weights as a lookup table aligned with emotion_labels, for batch scoring
+EMOTION_WEIGHTS = np.array([emotion_weights[label] for label in emotion_labels], dtype=np.float64)
+
+# Keras model that the TensorRT and INT8 artifacts are built from
+MODEL_PATH = os.getenv('MODEL_PATH', './models/emotion_model.h5')
+
+# TensorRT configuration
+USE_TENSORRT = os.getenv('USE_TENSORRT', 'true').lower() == 'true'
+TRT_ENGINE_DIR = os.getenv('TRT_ENGINE_DIR', './models')
+TRT_MAX_BATCH_SIZE = 32
+TRT_LOGGER = trt.Logger(trt.Logger.WARNING) if trt is not None else None
+
+# TensorFlow runtime configuration
+USE_XLA = os.getenv('USE_XLA', 'true').lower() == 'true'
+USE_MIXED_PRECISION = os.getenv('USE_MIXED_PRECISION', 'true').lower() == 'true'
+TF_NUM_INTRAOP_THREADS = int(os.getenv('TF_NUM_INTRAOP_THREADS', os.cpu_count() or 1))
+TF_NUM_INTEROP_THREADS = int(os.getenv('TF_NUM_INTEROP_THREADS', 2))
+
+# INT8 quantization configuration (CPU deployments without TensorRT)
+USE_INT8 = os.getenv('USE_INT8', 'true').lower() == 'true'
+TFLITE_MODEL_PATH = os.getenv('TFLITE_MODEL_PATH', './models/emotion_model_int8.tflite')
+CALIBRATION_DATA_DIR = os.getenv('CALIBRATION_DATA_DIR', './models/calibration')
+CALIBRATION_SAMPLES = 200
+
+# Decode and resize inside the TensorFlow graph for batch requests
+GRAPH_PREPROCESSING = os.getenv('GRAPH_PREPROCESSING', 'false').lower() == 'true'
+
+# Dynamic batching configuration
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 32))
+BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', 5))
+# Powers of two up to MAX_BATCH_SIZE (plus MAX_BATCH_SIZE itself); batches are padded to these
+BATCH_BUCKETS = tuple(sorted({min(2 ** i, MAX_BATCH_SIZE) for i in range(MAX_BATCH_SIZE.bit_length() + 1)}))
+BATCH_RESULT_TIMEOUT = 30
+inference_queue = queue.Queue()
+batch_worker = None
+
+def configure_tensorflow():
+    """Configure threading, XLA and mixed precision before any model is created"""
+    # Thread pools can only be sized before the TensorFlow runtime initializes
+    tf.config.threading.set_intra_op_parallelism_threads(TF_NUM_INTRAOP_THREADS)
+    tf.config.threading.set_inter_op_parallelism_threads(TF_NUM_INTEROP_THREADS)
+    
+    gpus = tf.config.list_physical_devices('GPU')
+    for gpu in gpus:
+        logger.info(f"GPU {gpu.name}: {tf.config.experimental.get_device_details(gpu)}")
+    
+    if USE_XLA:
+        tf.config.optimizer.set_jit(True)
+    
+    # Mixed precision only pays off on GPUs with tensor cores
+    if USE_MIXED_PRECISION and gpus:
+        tf.keras.mixed_precision.set_global_policy('mixed_float16')
+    
+    logger.info(
+        f"TensorFlow configured: gpus={len(gpus)}, xla={USE_XLA}, "
+        f"policy={tf.keras.mixed_precision.global_policy().name}, "
+        f"onednn={os.getenv('TF_ENABLE_ONEDNN_OPTS', 'default')}, "
+        f"threads={TF_NUM_INTRAOP_THREADS}/{TF_NUM_INTEROP_THREADS}"
+    )
 
 def load_emotion_model():
     """Load the pre-trained emotion detection model"""
-    global emotion_model
+    global emotion_model, emotion_infer, emotion_pipeline
     try:
-        model_path = os.getenv('MODEL_PATH', './models/emotion_model.h5')
+        model_path = MODEL_PATH
         if os.path.exists(model_path):
             emotion_model = tf.keras.models.load_model(model_path)
             logger.info(f"Emotion model loaded from {model_path}")
+            load_tensorrt_engine(model_path)
+            if trt_engine is None and not tf.config.list_physical_devices('GPU'):
+                load_tflite_model(model_path)
+            if trt_engine is None:
+                emotion_model = apply_mixed_precision(emotion_model)
         else:
             logger.warning(f"Model file not found at {model_path}, using placeholder model")
             # Create a simple placeholder model for demonstration
@@ -44,6 +143,75 @@ def load_emotion_model():
     except Exception as e:
         logger.error(f"Error loading emotion model: {e}")
         emotion_model = create_placeholder_model()
+    
+    emotion_infer = build_inference_function(emotion_model)
+    
+    if GRAPH_PREPROCESSING:
+        emotion_pipeline = build_preprocessing_pipeline()
+
+def apply_mixed_precision(model):
+    """Rebuild a loaded model under the mixed_float16 policy, keeping the output layer in float32"""
+    # load_model restores each layer's saved float32 dtype, so the global policy alone has no effect
+    if tf.keras.mixed_precision.global_policy().name != 'mixed_float16':
+        return model
+    output_layer = model.layers[-1]
+    
+    def clone_layer(layer):
+        config = layer.get_config()
+        config['dtype'] = 'float32' if layer is output_layer else 'mixed_float16'
+        return layer.__class__.from_config(config)
+    
+    mixed_model = tf.keras.models.clone_model(model, clone_function=clone_layer)
+    mixed_model.set_weights(model.get_weights())
+    logger.info("Emotion model rebuilt with mixed_float16 compute")
+    return mixed_model
+
+def build_inference_function(model):
+    """Wrap the model in a traced graph function so requests skip Python-side dispatch"""
+    @tf.function(input_signature=[tf.TensorSpec((None, 48, 48, 1), tf.float32)], jit_compile=USE_XLA)
+    def infer(image_batch):
+        return model(image_batch, training=False)
+    
+    return infer
+
+def build_preprocessing_pipeline():
+    """Fuse decode, grayscale, resize and normalization into one graph function"""
+    def decode(image_bytes):
+        image = tf.io.decode_image(image_bytes, channels=1, expand_animations=False)
+        # Area interpolation matches the OpenCV path (INTER_AREA)
+        image = tf.image.resize(image, (48, 48), method='area')
+        return image / 255.0
+    
+    @tf.function(input_signature=[tf.TensorSpec([None], tf.string)])
+    def pipeline(encoded_images):
+        return tf.map_fn(decode, encoded_images, fn_output_signature=tf.float32)
+    
+    return pipeline
+
+def warmup_model():
+    """Run dummy batches through the active backend so tracing and compilation happen at startup"""
+    global trt_engine, tflite_interpreter
+    if emotion_model is None:
+        return
+    while True:
+        try:
+            # Compile every bucket size up front so no request pays for a new shape
+            for batch_size in BATCH_BUCKETS:
+                start = time.perf_counter()
+                predict_batch(np.zeros((batch_size, 48, 48, 1), np.float32))
+                logger.info(f"Model warmup with batch size {batch_size} took {(time.perf_counter() - start) * 1000:.1f}ms")
+            return
+        except Exception as e:
+            # A backend that cannot run would make every request fail, so drop it and warm up the next one
+            if trt_engine is not None:
+                logger.error(f"TensorRT warmup failed, falling back to the next backend: {e}")
+                trt_engine = None
+            elif tflite_interpreter is not None:
+                logger.error(f"INT8 warmup failed, falling back to TensorFlow: {e}")
+                tflite_interpreter = None
+            else:
+                logger.error(f"Error warming up emotion model: {e}")
+                return
 
 def create_placeholder_model():
     """Create a simple placeholder model for demonstration purposes"""
@@ -55,91 +223,421 @@ def create_placeholder_model():
         tf.keras.layers.Conv2D(64, (3, 3), activation='relu'),
         tf.keras.layers.Flatten(),
         tf.keras.layers.Dense(64, activation='relu'),
-        tf.keras.layers.Dense(7, activation='softmax')
+        # Keep the softmax output in float32 for numerical stability under mixed precision
+        tf.keras.layers.Dense(7, activation='softmax', dtype='float32')
     ])
     model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
     return model
 
-def load_face_cascade():
-    """Load OpenCV face detection cascade"""
-    global face_cascade
+class TensorRTEmotionEngine:
+    """TensorRT execution context with pre-allocated pinned host and device buffers"""
+
+    def __init__(self, serialized_engine, max_batch_size=TRT_MAX_BATCH_SIZE):
+        self.max_batch_size = max_batch_size
+        self.lock = threading.Lock()
+        # Share the primary context with TensorFlow instead of creating a new one
+        self.cuda_context = cuda.Device(0).retain_primary_context()
+        self.cuda_context.push()
+        try:
+            runtime = trt.Runtime(TRT_LOGGER)
+            self.engine = runtime.deserialize_cuda_engine(serialized_engine)
+            self.context = self.engine.create_execution_context()
+            self.stream = cuda.Stream()
+            self.host_input = cuda.pagelocked_empty((max_batch_size, 48, 48, 1), np.float32)
+            self.host_output = cuda.pagelocked_empty((max_batch_size, NUM_EMOTIONS), np.float32)
+            self.device_input = cuda.mem_alloc(self.host_input.nbytes)
+            self.device_output = cuda.mem_alloc(self.host_output.nbytes)
+            
+            # Bind the fixed device buffers to the engine's input and output tensors by name
+            tensor_names = [self.engine.get_tensor_name(i) for i in range(self.engine.num_io_tensors)]
+            self.input_name = next(
+                name for name in tensor_names
+                if self.engine.get_tensor_mode(name) == trt.TensorIOMode.INPUT
+            )
+            self.output_name = next(
+                name for name in tensor_names
+                if self.engine.get_tensor_mode(name) == trt.TensorIOMode.OUTPUT
+            )
+            self.context.set_tensor_address(self.input_name, int(self.device_input))
+            self.context.set_tensor_address(self.output_name, int(self.device_output))
+        finally:
+            self.cuda_context.pop()
+
+    def infer(self, image_batch):
+        """Run inference on a (N, 48, 48, 1) batch, splitting it to fit the engine profile"""
+        outputs = [
+            self._infer_chunk(image_batch[start:start + self.max_batch_size])
+            for start in range(0, len(image_batch), self.max_batch_size)
+        ]
+        return np.concatenate(outputs, axis=0)
+
+    def _infer_chunk(self, chunk):
+        batch_size = len(chunk)
+        with self.lock:
+            self.cuda_context.push()
+            try:
+                self.host_input[:batch_size] = chunk
+                self.context.set_input_shape(self.input_name, (batch_size, 48, 48, 1))
+                cuda.memcpy_htod_async(self.device_input, self.host_input[:batch_size], self.stream)
+                self.context.execute_async_v3(self.stream.handle)
+                cuda.memcpy_dtoh_async(self.host_output[:batch_size], self.device_output, self.stream)
+                self.stream.synchronize()
+                return self.host_output[:batch_size].copy()
+            finally:
+                self.cuda_context.pop()
+
+def build_tensorrt_engine(model):
+    """Export the Keras model to ONNX and build a serialized FP16 TensorRT engine"""
+    import tf2onnx
+
+    input_signature = [tf.TensorSpec((None, 48, 48, 1), tf.float32, name='input')]
+    onnx_model, _ = tf2onnx.convert.from_keras(model, input_signature=input_signature)
+
+    builder = trt.Builder(TRT_LOGGER)
+    # Explicit batch is the only mode in TensorRT 10, where the flag is deprecated
+    if int(trt.__version__.split('.')[0]) >= 10:
+        network_flags = 0
+    else:
+        network_flags = 1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH)
+    network = builder.create_network(network_flags)
+    parser = trt.OnnxParser(network, TRT_LOGGER)
+    if not parser.parse(onnx_model.SerializeToString()):
+        errors = [str(parser.get_error(i)) for i in range(parser.num_errors)]
+        raise RuntimeError(f"Failed to parse ONNX model: {errors}")
+
+    # TensorRT keeps FP32 kernels for layers where the GPU has no faster FP16 path
+    config = builder.create_builder_config()
+    config.set_flag(trt.BuilderFlag.FP16)
+
+    # Dynamic batch dimension: min=1, opt=8, max=TRT_MAX_BATCH_SIZE
+    profile = builder.create_optimization_profile()
+    profile.set_shape(
+        network.get_input(0).name,
+        (1, 48, 48, 1),
+        (8, 48, 48, 1),
+        (TRT_MAX_BATCH_SIZE, 48, 48, 1)
+    )
+    config.add_optimization_profile(profile)
+
+    serialized_engine = builder.build_serialized_network(network, config)
+    if serialized_engine is None:
+        raise RuntimeError("TensorRT engine build failed")
+    return bytes(serialized_engine)
+
+def write_artifact(path, data):
+    """Atomically write a model artifact so concurrent readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
     try:
-        # Try to load from OpenCV data directory
-        cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        face_cascade = cv2.CascadeClassifier(cascade_path)
-        if face_cascade.empty():
-            raise Exception("Failed to load face cascade")
-        logger.info("Face detection cascade loaded successfully")
-    except Exception as e:
-        logger.error(f"Error loading face cascade: {e}")
-        face_cascade = None
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
-def preprocess_image(image_data):
-    """Preprocess image for emotion detection"""
+def ensure_tensorrt_engine(model, model_path):
+    """Return the cached TensorRT engine path for the model, building it if missing"""
+    if not USE_TENSORRT or trt is None:
+        return None
+    cuda.init()
+    if cuda.Device.count() == 0:
+        logger.info("No CUDA device available, skipping TensorRT engine")
+        return None
+
+    # Serialized engines are only valid for the GPU, TensorRT version and weights they were built with
+    device = cuda.Device(0)
+    cache_key = hashlib.sha1(
+        f"{device.name()}:{device.pci_bus_id()}:{trt.__version__}:"
+        f"{os.path.abspath(model_path)}:{os.path.getmtime(model_path)}".encode()
+    ).hexdigest()[:16]
+    engine_path = os.path.join(TRT_ENGINE_DIR, f"emotion_model_{cache_key}.engine")
+
+    if not os.path.exists(engine_path):
+        write_artifact(engine_path, build_tensorrt_engine(model))
+        logger.info(f"TensorRT engine built and cached at {engine_path}")
+    return engine_path
+
+def load_tensorrt_engine(model_path):
+    """Load a cached TensorRT engine for the model, building it on first use"""
+    global trt_engine
     try:
-        # Convert base64 to image
-        if isinstance(image_data, str):
-            # Remove data URL prefix if present
-            if image_data.startswith('data:image'):
-                image_data = image_data.split(',')[1]
-            
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes))
-        else:
-            image = Image.open(image_data)
+        engine_path = ensure_tensorrt_engine(emotion_model, model_path)
+        if engine_path is None:
+            return
+
+        with open(engine_path, 'rb') as f:
+            trt_engine = TensorRTEmotionEngine(f.read())
+        logger.info(f"TensorRT engine loaded from {engine_path}")
+    except Exception as e:
+        logger.error(f"Error loading TensorRT engine, falling back to TensorFlow: {e}")
+        trt_engine = None
+
+class TFLiteEmotionInterpreter:
+    """INT8 TFLite interpreters, one per batch bucket, that quantize inputs and dequantize outputs"""
+
+    def __init__(self, model_path):
+        # Tensors are allocated once per bucket size, so infer never resizes or reallocates
+        self.interpreters = {}
+        for batch_size in BATCH_BUCKETS:
+            interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=TF_NUM_INTRAOP_THREADS)
+            input_index = interpreter.get_input_details()[0]['index']
+            interpreter.resize_tensor_input(input_index, (batch_size, 48, 48, 1))
+            interpreter.allocate_tensors()
+            self.interpreters[batch_size] = (interpreter, threading.Lock())
+        self.input_details = interpreter.get_input_details()[0]
+        self.output_details = interpreter.get_output_details()[0]
+
+    def infer(self, image_batch):
+        """Run inference on a (N, 48, 48, 1) float batch, N in BATCH_BUCKETS, and return float probabilities"""
+        interpreter, lock = self.interpreters[len(image_batch)]
+        input_scale, input_zero_point = self.input_details['quantization']
+        quantized = np.clip(np.round(image_batch / input_scale + input_zero_point), -128, 127).astype(np.int8)
         
-        # Convert to grayscale
-        if image.mode != 'L':
-            image = image.convert('L')
+        with lock:
+            interpreter.set_tensor(self.input_details['index'], quantized)
+            interpreter.invoke()
+            output = interpreter.get_tensor(self.output_details['index'])
         
-        # Resize to 48x48 (standard for emotion detection)
-        image = image.resize((48, 48))
+        output_scale, output_zero_point = self.output_details['quantization']
+        return (output.astype(np.float32) - output_zero_point) * output_scale
+
+def representative_dataset():
+    """Yield preprocessed frames from the calibration directory for INT8 calibration"""
+    for filename in sorted(os.listdir(CALIBRATION_DATA_DIR))[:CALIBRATION_SAMPLES]:
+        with open(os.path.join(CALIBRATION_DATA_DIR, filename), 'rb') as f:
+            image_array = preprocess_image(f.read())
+        if image_array is not None:
+            yield [image_array]
+
+def quantize_emotion_model(model):
+    """Convert the Keras model to a fully INT8-quantized TFLite flatbuffer"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    return converter.convert()
+
+def ensure_tflite_model(model, model_path):
+    """Quantize the model to TFLITE_MODEL_PATH if it is missing or stale; return whether it exists"""
+    if not USE_INT8:
+        return False
+    is_stale = (
+        not os.path.exists(TFLITE_MODEL_PATH)
+        or os.path.getmtime(TFLITE_MODEL_PATH) < os.path.getmtime(model_path)
+    )
+    if is_stale:
+        if not os.path.isdir(CALIBRATION_DATA_DIR) or not os.listdir(CALIBRATION_DATA_DIR):
+            logger.warning(f"No calibration images in {CALIBRATION_DATA_DIR}, skipping INT8 quantization")
+            return False
         
-        # Convert to numpy array and normalize
-        image_array = np.array(image)
-        image_array = image_array.astype('float32') / 255.0
+        write_artifact(TFLITE_MODEL_PATH, quantize_emotion_model(model))
+        logger.info(f"INT8 model quantized and saved to {TFLITE_MODEL_PATH}")
+    return True
+
+def load_tflite_model(model_path):
+    """Load the INT8 TFLite model, quantizing the Keras model if it is missing or stale"""
+    global tflite_interpreter
+    try:
+        if not ensure_tflite_model(emotion_model, model_path):
+            return
         
-        # Add batch and channel dimensions
-        image_array = np.expand_dims(image_array, axis=[0, -1])
+        tflite_interpreter = TFLiteEmotionInterpreter(TFLITE_MODEL_PATH)
+        logger.info(f"INT8 TFLite model loaded from {TFLITE_MODEL_PATH}")
+    except Exception as e:
+        logger.error(f"Error loading INT8 model, falling back to TensorFlow: {e}")
+        tflite_interpreter = None
+
+# JPEG start-of-frame markers (SOF0-SOF15, excluding DHT, JPG and DAC)
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+)
+
+def jpeg_dimensions(data):
+    """Read (width, height) from a JPEG's start-of-frame header, or None if it is not a JPEG"""
+    data = memoryview(data)
+    if data[:2] != b'\xff\xd8':
+        return None
+    
+    offset = 2
+    while offset + 9 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            offset += 1
+        elif marker in JPEG_SOF_MARKERS:
+            return int.from_bytes(data[offset + 7:offset + 9], 'big'), int.from_bytes(data[offset + 5:offset + 7], 'big')
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Standalone markers carry no length field
+            offset += 2
+        else:
+            offset += 2 + int.from_bytes(data[offset + 2:offset + 4], 'big')
+    return None
+
+def decode_image_bytes(image_bytes):
+    """Decode encoded image bytes into a 48x48 grayscale uint8 array"""
+    buffer = np.frombuffer(image_bytes, np.uint8)
+    
+    # For JPEG, decode once at the smallest DCT scale that keeps both sides >= 48,
+    # so libjpeg-turbo never produces most of the full-resolution pixels. Other
+    # formats (PNG, WebP) have no reduced decode and are decoded in full once.
+    flag = cv2.IMREAD_GRAYSCALE
+    size = jpeg_dimensions(buffer)
+    if size is not None:
+        for factor, reduced_flag in REDUCED_DECODE_FLAGS:
+            if min(size) // factor >= 48:
+                flag = reduced_flag
+                break
+    
+    image = cv2.imdecode(buffer, flag)
+    if image is None:
+        raise ValueError("Unable to decode image data")
+    
+    # Resize to 48x48 (standard for emotion detection)
+    return cv2.resize(image, (48, 48), interpolation=cv2.INTER_AREA)
+
+def read_image_bytes(image_data):
+    """Get encoded image bytes from a base64 string, raw bytes or a file object"""
+    # Convert base64 to image bytes
+    if isinstance(image_data, str):
+        # Remove data URL prefix if present
+        if image_data.startswith('data:image'):
+            image_data = image_data.split(',')[1]
         
-        return image_array
+        return base64.b64decode(image_data)
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        return image_data
+    return image_data.read()
+
+def preprocess_image(image_data):
+    """Preprocess image for emotion detection"""
+    try:
+        image = decode_image_bytes(read_image_bytes(image_data))
+        
+        # Cast and normalize in a single pass, then add batch and channel dimensions as a view
+        image_array = np.multiply(image, np.float32(1.0 / 255.0), dtype=np.float32)
+        return image_array[np.newaxis, :, :, np.newaxis]
     except Exception as e:
         logger.error(f"Error preprocessing image: {e}")
         return None
 
+def predict_batch(image_batch):
+    """Run the emotion model on a (N, 48, 48, 1) batch and return class probabilities"""
+    # Split into chunks of at most MAX_BATCH_SIZE and pad each one up to a bucket size,
+    # so XLA and the other compiled backends only ever see BATCH_BUCKETS shapes
+    predictions = []
+    for start in range(0, len(image_batch), MAX_BATCH_SIZE):
+        chunk = image_batch[start:start + MAX_BATCH_SIZE]
+        chunk_size = len(chunk)
+        bucket_size = next(size for size in BATCH_BUCKETS if size >= chunk_size)
+        if bucket_size > chunk_size:
+            padded = np.zeros((bucket_size, 48, 48, 1), np.float32)
+            padded[:chunk_size] = chunk
+            chunk = padded
+        predictions.append(run_inference_backend(chunk)[:chunk_size])
+    return np.concatenate(predictions, axis=0)
+
+def run_inference_backend(image_batch):
+    """Run the active inference backend on a batch whose size is one of BATCH_BUCKETS"""
+    if trt_engine is not None:
+        return trt_engine.infer(image_batch)
+    if tflite_interpreter is not None:
+        return tflite_interpreter.infer(image_batch)
+    return emotion_infer(image_batch).numpy()
+
+def classify_encoded_batch(encoded_images):
+    """Return predicted emotion indices and confidences for a list of encoded images"""
+    # The model runs through predict_batch so the batch is bucketed like every other call
+    predictions = predict_batch(emotion_pipeline(tf.constant(encoded_images)).numpy())
+    emotion_idx = predictions.argmax(axis=1)
+    confidence = predictions[np.arange(len(emotion_idx)), emotion_idx]
+    return emotion_idx, confidence
+
+def classify_batch(image_batch):
+    """Return predicted emotion indices and confidences for a (N, 48, 48, 1) batch"""
+    if emotion_model is None:
+        # Return random emotions for demonstration
+        emotion_idx = RNG.integers(0, NUM_EMOTIONS, size=len(image_batch))
+        confidence = RNG.uniform(0.6, 0.95, size=len(image_batch))
+        return emotion_idx, confidence
+
+    predictions = predict_batch(image_batch)
+    emotion_idx = predictions.argmax(axis=1)
+    confidence = predictions[np.arange(len(emotion_idx)), emotion_idx]
+    return emotion_idx, confidence
+
 def detect_emotion(image_array):
     """Detect emotion from preprocessed image"""
     try:
-        if emotion_model is None:
-            # Return random emotion for demonstration
-            import random
-            emotion_idx = random.randint(0, len(emotion_labels) - 1)
-            confidence = random.uniform(0.6, 0.95)
-            return emotion_labels[emotion_idx], confidence
-        
-        # Predict emotion
-        predictions = emotion_model.predict(image_array, verbose=0)
-        emotion_idx = np.argmax(predictions[0])
-        confidence = float(predictions[0][emotion_idx])
-        
-        return emotion_labels[emotion_idx], confidence
+        emotion_idx, confidence = classify_batch(image_array)
+        return emotion_labels[emotion_idx[0]], float(confidence[0])
     except Exception as e:
         logger.error(f"Error detecting emotion: {e}")
         return 'neutral', 0.5
 
+def batch_inference_worker():
+    """Collect queued requests into batches and run one forward pass per batch"""
+    window = BATCH_WINDOW_MS / 1000.0
+    while True:
+        pending = [inference_queue.get()]
+        deadline = time.monotonic() + window
+
+        # Keep collecting until the batch is full or the window closes
+        while len(pending) < MAX_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(inference_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        try:
+            batch = np.concatenate([item['image'] for item in pending], axis=0)
+            emotion_idx, confidence = classify_batch(batch)
+            engagement_scores = calculate_engagement_scores_vec(emotion_idx, confidence)
+            for item, idx, conf, score in zip(pending, emotion_idx, confidence, engagement_scores):
+                item['result'] = (emotion_labels[idx], float(conf), float(score))
+        except Exception as e:
+            logger.error(f"Error in batched emotion detection: {e}")
+            for item in pending:
+                item['result'] = ('neutral', 0.5, calculate_engagement_score('neutral', 0.5))
+        finally:
+            for item in pending:
+                item['done'].set()
+
+def start_batch_worker():
+    """Start the background thread that serves batched inference requests"""
+    global batch_worker
+    batch_worker = threading.Thread(target=batch_inference_worker, name='emotion-batcher', daemon=True)
+    batch_worker.start()
+    logger.info(f"Batching worker started (max_batch={MAX_BATCH_SIZE}, window={BATCH_WINDOW_MS}ms)")
+
+def detect_emotion_batched(image_array):
+    """Detect emotion and engagement score by queueing the image for the batching worker"""
+    if batch_worker is None:
+        emotion, confidence = detect_emotion(image_array)
+        return emotion, confidence, calculate_engagement_score(emotion, confidence)
+
+    item = {'image': image_array, 'done': threading.Event(), 'result': None}
+    inference_queue.put(item)
+    if not item['done'].wait(BATCH_RESULT_TIMEOUT):
+        logger.error("Timed out waiting for batched emotion detection")
+        return 'neutral', 0.5, calculate_engagement_score('neutral', 0.5)
+    return item['result']
+
 def calculate_engagement_score(emotion, confidence):
     """Calculate engagement score based on emotion and confidence"""
-    # Define emotion weights (higher = more engaged)
-    emotion_weights = {
-        'happy': 0.9,
-        'surprise': 0.8,
-        'neutral': 0.7,
-        'fear': 0.4,
-        'sad': 0.3,
-        'angry': 0.2,
-        'disgust': 0.1
-    }
-    
     # Base score from emotion
     base_score = emotion_weights.get(emotion, 0.5)
     
@@ -149,75 +647,235 @@ def calculate_engagement_score(emotion, confidence):
     # Normalize to 0-1 range
     return max(0.0, min(1.0, adjusted_score))
 
+def calculate_engagement_scores_vec(emotion_idx, confidence):
+    """Calculate engagement scores for arrays of emotion indices and confidences"""
+    # Score in float64 so results match calculate_engagement_score exactly
+    confidence = np.asarray(confidence, dtype=np.float64)
+    adjusted_scores = EMOTION_WEIGHTS[emotion_idx] * confidence + (1 - confidence) * 0.5
+    return np.clip(adjusted_scores, 0.0, 1.0)
+
+# Read-modify-write of the session summary, run atomically inside Redis
+SESSION_SUMMARY_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+local summary
+if current then
+    summary = cjson.decode(current)
+else
+    summary = {total_students = 0, emotions = {}, average_engagement = 0.0}
+end
+summary['emotions'][ARGV[1]] = (summary['emotions'][ARGV[1]] or 0) + 1
+summary['last_updated'] = ARGV[2]
+redis.call('SETEX', KEYS[1], ARGV[3], cjson.encode(summary))
+return 1
+"""
+BATCH_REDIS = os.getenv('BATCH_REDIS', 'true').lower() == 'true'
+session_summary_sha = None
+
+# Connection pool configuration
+PG_POOL_MAX_CONNECTIONS = int(os.getenv('PG_POOL_MAX_CONNECTIONS', 32))
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 64))
+
+# Bound how long a request thread can be blocked on an unresponsive backend
+PG_CONNECT_TIMEOUT = int(os.getenv('PG_CONNECT_TIMEOUT', 5))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 1.0))
+pg_pool = None
+pg_pool_lock = threading.Lock()
+redis_client = None
+
+def get_database_pool():
+    """Get the shared PostgreSQL connection pool, creating it on first use"""
+    global pg_pool
+    with pg_pool_lock:
+        if pg_pool is None:
+            pg_pool = ThreadedConnectionPool(
+                1, PG_POOL_MAX_CONNECTIONS, os.getenv('DATABASE_URL'), connect_timeout=PG_CONNECT_TIMEOUT
+            )
+    return pg_pool
+
+@contextmanager
 def get_database_connection():
-    """Get PostgreSQL database connection"""
+    """Borrow a PostgreSQL connection from the pool, yielding None if unavailable"""
     try:
-        return psycopg2.connect(os.getenv('DATABASE_URL'))
+        pool = get_database_pool()
+        conn = pool.getconn()
     except Exception as e:
         logger.error(f"Database connection error: {e}")
-        return None
+        yield None
+        return
+    
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        # Drop connections that were closed underneath us instead of reusing them
+        pool.putconn(conn, close=bool(conn.closed))
 
 def get_redis_connection():
-    """Get Redis connection"""
-    try:
-        return redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379'))
-    except Exception as e:
-        logger.error(f"Redis connection error: {e}")
-        return None
+    """Get the shared Redis client backed by a connection pool"""
+    global redis_client
+    if redis_client is None:
+        try:
+            redis_client = redis.Redis.from_url(
+                os.getenv('REDIS_URL', 'redis://localhost:6379'),
+                max_connections=REDIS_MAX_CONNECTIONS,
+                socket_keepalive=True,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT
+            )
+        except Exception as e:
+            logger.error(f"Redis connection error: {e}")
+            return None
+    return redis_client
+
+# Recent predictions keyed by (session, student, perceptual hash of the frame). The cache is
+# per process and needs no invalidation: a finished session's keys are never looked up again,
+# so LRU eviction reclaims them
+FRAME_CACHE_SIZE = int(os.getenv('FRAME_CACHE_SIZE', 4096))
+frame_cache = collections.OrderedDict()
+frame_cache_lock = threading.Lock()
+frame_cache_stats = {'hits': 0, 'misses': 0}
+
+def frame_hash(image_array):
+    """Compute a 64-bit average hash of a preprocessed (1, 48, 48, 1) frame"""
+    thumbnail = cv2.resize(image_array[0, :, :, 0], (8, 8), interpolation=cv2.INTER_AREA)
+    return np.packbits(thumbnail > thumbnail.mean()).tobytes()
+
+def get_cached_emotion(cache_key):
+    """Look up a cached prediction for a frame, updating hit/miss counters"""
+    with frame_cache_lock:
+        result = frame_cache.get(cache_key)
+        if result is None:
+            frame_cache_stats['misses'] += 1
+        else:
+            frame_cache.move_to_end(cache_key)
+            frame_cache_stats['hits'] += 1
+        return result
+
+def cache_emotion(cache_key, result):
+    """Store a prediction for a frame, evicting the least recently used entries"""
+    with frame_cache_lock:
+        frame_cache[cache_key] = result
+        frame_cache.move_to_end(cache_key)
+        while len(frame_cache) > FRAME_CACHE_SIZE:
+            frame_cache.popitem(last=False)
+
+def frame_cache_hit_ratio():
+    """Fraction of frame cache lookups that skipped inference"""
+    lookups = frame_cache_stats['hits'] + frame_cache_stats['misses']
+    return frame_cache_stats['hits'] / lookups if lookups else 0.0
+
+# Buffered engagement_metrics inserts
+INSERT_FLUSH_INTERVAL = float(os.getenv('INSERT_FLUSH_INTERVAL_MS', 500)) / 1000.0
+INSERT_FLUSH_ROWS = int(os.getenv('INSERT_FLUSH_ROWS', 500))
+insert_buffer = collections.deque()
+insert_buffer_lock = threading.Lock()
+insert_flush_event = threading.Event()
+insert_flusher = None
+ENGAGEMENT_INSERT_SQL = """
+    INSERT INTO engagement_metrics (session_id, student_id, timestamp, emotion, confidence, engagement_score)
+    VALUES %s
+"""
+
+# Formatted timestamp for the current second, shared by all requests
+cached_timestamp = (0, '')
+
+def now_iso():
+    """Current UTC time as an ISO 8601 string, formatted at most once per second"""
+    global cached_timestamp
+    now = int(time.time())
+    if now != cached_timestamp[0]:
+        # Swapping in a new tuple is atomic, so concurrent requests never see a torn value
+        cached_timestamp = (now, datetime.fromtimestamp(now, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'))
+    return cached_timestamp[1]
+
+def json_response(payload, status=200):
+    """Serialize a response payload with orjson"""
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    return json_response({
         'status': 'healthy',
         'service': 'ML Emotion Detection Service',
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': now_iso(),
         'model_loaded': emotion_model is not None,
-        'face_cascade_loaded': face_cascade is not None
+        'frame_cache_hit_ratio': frame_cache_hit_ratio()
     })
 
 @app.route('/detect_emotion', methods=['POST'])
 def detect_emotion_endpoint():
     """Main endpoint for emotion detection"""
     try:
-        data = request.get_json()
-        
-        if not data or 'image' not in data:
-            return jsonify({'error': 'Image data required'}), 400
-        
-        # Extract data
-        image_data = data['image']
-        session_id = data.get('session_id')
-        student_id = data.get('student_id')
+        # Raw image and multipart uploads skip the base64 round trip of the JSON body
+        if request.mimetype.startswith('image/'):
+            # Raw image body, with session and student passed as query params
+            image_data = request.get_data(cache=False)
+            session_id = request.args.get('session_id', type=int)
+            student_id = request.args.get('student_id', type=int)
+            
+            if not image_data:
+                return json_response({'error': 'Image data required'}, 400)
+            
+        elif request.mimetype == 'multipart/form-data':
+            upload = request.files.get('image')
+            if upload is None:
+                return json_response({'error': 'Image data required'}, 400)
+            
+            image_data = upload.stream
+            session_id = request.form.get('session_id', type=int) or request.args.get('session_id', type=int)
+            student_id = request.form.get('student_id', type=int) or request.args.get('student_id', type=int)
+            
+        else:
+            data = request.get_json()
+            
+            if not data or 'image' not in data:
+                return json_response({'error': 'Image data required'}, 400)
+            
+            # Extract data
+            image_data = data['image']
+            session_id = data.get('session_id')
+            student_id = data.get('student_id')
         
         # Preprocess image
         processed_image = preprocess_image(image_data)
         if processed_image is None:
-            return jsonify({'error': 'Failed to process image'}), 400
+            return json_response({'error': 'Failed to process image'}, 400)
         
-        # Detect emotion
-        emotion, confidence = detect_emotion(processed_image)
+        # Reuse the last prediction when this student's frame has barely changed
+        cache_key = (str(session_id), str(student_id), frame_hash(processed_image)) if student_id else None
+        cached_result = get_cached_emotion(cache_key) if cache_key else None
         
-        # Calculate engagement score
-        engagement_score = calculate_engagement_score(emotion, confidence)
+        # Detect emotion and calculate engagement score
+        if cached_result is not None:
+            emotion, confidence, engagement_score = cached_result
+        else:
+            emotion, confidence, engagement_score = detect_emotion_batched(processed_image)
+            if cache_key:
+                cache_emotion(cache_key, (emotion, confidence, engagement_score))
+        
+        # One timestamp for the database row, the cached entry and the response
+        timestamp = now_iso()
         
         # Store in database if session and student info provided
         if session_id and student_id:
-            store_engagement_data(session_id, student_id, emotion, confidence, engagement_score)
+            store_engagement_data(session_id, student_id, emotion, confidence, engagement_score, timestamp)
         
         # Cache recent results in Redis
-        cache_engagement_data(session_id, student_id, emotion, confidence, engagement_score)
+        cache_engagement_data(session_id, student_id, emotion, confidence, engagement_score, timestamp)
         
-        return jsonify({
+        return json_response({
             'emotion': emotion,
             'confidence': confidence,
             'engagement_score': engagement_score,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': timestamp
         })
         
     except Exception as e:
         logger.error(f"Error in emotion detection endpoint: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return json_response({'error': 'Internal server error'}, 500)
 
 @app.route('/detect_emotion_batch', methods=['POST'])
 def detect_emotion_batch():
@@ -226,114 +884,226 @@ def detect_emotion_batch():
         data = request.get_json()
         
         if not data or 'images' not in data:
-            return jsonify({'error': 'Images array required'}), 400
+            return json_response({'error': 'Images array required'}, 400)
         
         images = data['images']
         session_id = data.get('session_id')
         student_id = data.get('student_id')
         
-        results = []
+        results = [None] * len(images)
+        classified = None
         
-        for i, image_data in enumerate(images):
+        # Decode, resize and classify entirely inside the TensorFlow graph when enabled
+        if emotion_pipeline is not None:
             try:
-                # Preprocess image
+                encoded_images = [bytes(read_image_bytes(image_data)) for image_data in images]
+                processed_indices = list(range(len(images)))
+                classified = classify_encoded_batch(encoded_images)
+            except Exception as e:
+                logger.warning(f"Graph preprocessing failed, falling back to OpenCV: {e}")
+        
+        if classified is None:
+            processed_images = []
+            processed_indices = []
+            
+            # Preprocess all images, keeping track of which ones failed
+            for i, image_data in enumerate(images):
                 processed_image = preprocess_image(image_data)
                 if processed_image is None:
-                    results.append({
+                    results[i] = {
                         'index': i,
                         'error': 'Failed to process image'
-                    })
+                    }
                     continue
                 
-                # Detect emotion
-                emotion, confidence = detect_emotion(processed_image)
-                engagement_score = calculate_engagement_score(emotion, confidence)
+                processed_images.append(processed_image)
+                processed_indices.append(i)
+        
+        # Run a single forward pass over all successfully processed images
+        if processed_indices:
+            try:
+                if classified is None:
+                    batch = np.concatenate(processed_images, axis=0)
+                    classified = classify_batch(batch)
+                
+                emotion_idx, confidence = classified
+                engagement_scores = calculate_engagement_scores_vec(emotion_idx, confidence)
                 
-                results.append({
-                    'index': i,
-                    'emotion': emotion,
-                    'confidence': confidence,
-                    'engagement_score': engagement_score
-                })
+                for i, idx, conf, score in zip(processed_indices, emotion_idx, confidence, engagement_scores):
+                    results[i] = {
+                        'index': i,
+                        'emotion': emotion_labels[idx],
+                        'confidence': float(conf),
+                        'engagement_score': float(score)
+                    }
                 
             except Exception as e:
-                logger.error(f"Error processing image {i}: {e}")
-                results.append({
-                    'index': i,
-                    'error': str(e)
-                })
+                logger.error(f"Error processing image batch: {e}")
+                for i in processed_indices:
+                    results[i] = {
+                        'index': i,
+                        'error': str(e)
+                    }
         
-        return jsonify({
+        return json_response({
             'results': results,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': now_iso()
         })
         
     except Exception as e:
         logger.error(f"Error in batch emotion detection: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return json_response({'error': 'Internal server error'}, 500)
 
-def store_engagement_data(session_id, student_id, emotion, confidence, engagement_score):
-    """Store engagement data in PostgreSQL"""
+def parse_id(value):
+    """Coerce a session or student id from a request to a positive int, or None if invalid"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None
     try:
-        conn = get_database_connection()
-        if conn is None:
+        parsed = int(value)
+    except ValueError:
+        return None
+    return parsed if parsed > 0 else None
+
+def store_engagement_data(session_id, student_id, emotion, confidence, engagement_score, timestamp):
+    """Queue engagement data for a batched insert into PostgreSQL"""
+    # A malformed id would fail the whole batched insert, so reject it before it is buffered
+    row_session_id, row_student_id = parse_id(session_id), parse_id(student_id)
+    if row_session_id is None or row_student_id is None:
+        logger.warning(f"Not storing engagement data with invalid ids: session_id={session_id!r}, student_id={student_id!r}")
+        return
+    
+    with insert_buffer_lock:
+        insert_buffer.append((row_session_id, row_student_id, timestamp, emotion, confidence, engagement_score))
+        buffered_rows = len(insert_buffer)
+    
+    if insert_flusher is None:
+        flush_engagement_data()
+    elif buffered_rows >= INSERT_FLUSH_ROWS:
+        insert_flush_event.set()
+
+def flush_engagement_data():
+    """Write all buffered engagement rows to PostgreSQL in a single statement"""
+    with insert_buffer_lock:
+        if not insert_buffer:
             return
-        
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO engagement_metrics (session_id, student_id, timestamp, emotion, confidence, engagement_score)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (session_id, student_id, datetime.now(), emotion, confidence, engagement_score))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        logger.debug(f"Stored engagement data: session={session_id}, student={student_id}, emotion={emotion}")
+        rows = list(insert_buffer)
+        insert_buffer.clear()
+    
+    try:
+        with get_database_connection() as conn:
+            if conn is None:
+                logger.error(f"Dropping {len(rows)} engagement rows: database unavailable")
+                return
+            
+            try:
+                with conn.cursor() as cursor:
+                    execute_values(cursor, ENGAGEMENT_INSERT_SQL, rows, page_size=INSERT_FLUSH_ROWS)
+                conn.commit()
+                logger.debug(f"Stored {len(rows)} engagement rows")
+            except psycopg2.DatabaseError as e:
+                # One bad row (e.g. a foreign key violation) fails the whole statement,
+                # so retry row by row and only drop the rows that fail on their own
+                conn.rollback()
+                logger.warning(f"Batched engagement insert failed, retrying row by row: {e}")
+                insert_engagement_rows(conn, rows)
         
     except Exception as e:
         logger.error(f"Error storing engagement data: {e}")
 
-def cache_engagement_data(session_id, student_id, emotion, confidence, engagement_score):
+def insert_engagement_rows(conn, rows):
+    """Insert rows one at a time under savepoints, skipping the ones that fail"""
+    dropped = 0
+    with conn.cursor() as cursor:
+        for row in rows:
+            cursor.execute("SAVEPOINT engagement_row")
+            try:
+                execute_values(cursor, ENGAGEMENT_INSERT_SQL, [row])
+            except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT engagement_row")
+                logger.error(f"Dropping engagement row {row[:2]}: {e}")
+                dropped += 1
+            else:
+                cursor.execute("RELEASE SAVEPOINT engagement_row")
+    conn.commit()
+    logger.debug(f"Stored {len(rows) - dropped} engagement rows, dropped {dropped}")
+
+def insert_flush_worker():
+    """Flush buffered engagement rows periodically or when the buffer fills up"""
+    while True:
+        insert_flush_event.wait(INSERT_FLUSH_INTERVAL)
+        insert_flush_event.clear()
+        flush_engagement_data()
+
+def start_insert_flusher():
+    """Start the background thread that flushes buffered engagement rows"""
+    global insert_flusher
+    insert_flusher = threading.Thread(target=insert_flush_worker, name='engagement-flusher', daemon=True)
+    insert_flusher.start()
+    
+    # Write out whatever is still buffered when the process exits
+    atexit.register(flush_engagement_data)
+
+def get_session_summary_sha(redis_conn):
+    """Load the session summary update script into Redis once and return its SHA"""
+    global session_summary_sha
+    if session_summary_sha is None:
+        session_summary_sha = redis_conn.script_load(SESSION_SUMMARY_SCRIPT)
+    return session_summary_sha
+
+def student_engagement_key(session_id, student_id):
+    """Redis key for a student's most recent engagement result"""
+    return f"engagement:session:{session_id}:student:{student_id}"
+
+def session_summary_key(session_id):
+    """Redis key for a session's running emotion summary"""
+    return f"session:{session_id}:summary"
+
+def empty_session_summary():
+    """Summary returned for sessions that have nothing cached yet"""
+    return {
+        'total_students': 0,
+        'emotions': {},
+        'average_engagement': 0.0,
+        'last_updated': now_iso()
+    }
+
+def cache_engagement_data(session_id, student_id, emotion, confidence, engagement_score, timestamp):
     """Cache engagement data in Redis for real-time access"""
+    global session_summary_sha
     try:
         redis_conn = get_redis_connection()
         if redis_conn is None:
             return
         
-        # Cache key format: engagement:session:{session_id}:student:{student_id}
-        cache_key = f"engagement:session:{session_id}:student:{student_id}"
+        cache_key = student_engagement_key(session_id, student_id)
+        session_key = session_summary_key(session_id)
         
         data = {
             'emotion': emotion,
             'confidence': confidence,
             'engagement_score': engagement_score,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': timestamp
         }
         
-        # Cache for 5 minutes
-        redis_conn.setex(cache_key, 300, json.dumps(data))
-        
-        # Also cache in session summary
-        session_key = f"session:{session_id}:summary"
-        session_data = redis_conn.get(session_key)
-        
-        if session_data:
-            summary = json.loads(session_data)
-        else:
-            summary = {
-                'total_students': 0,
-                'emotions': {},
-                'average_engagement': 0.0,
-                'last_updated': datetime.now().isoformat()
-            }
-        
-        # Update summary
-        summary['emotions'][emotion] = summary['emotions'].get(emotion, 0) + 1
-        summary['last_updated'] = datetime.now().isoformat()
-        
-        # Cache session summary for 10 minutes
-        redis_conn.setex(session_key, 600, json.dumps(summary))
+        # Retry once if Redis has dropped the script (restart or SCRIPT FLUSH)
+        for attempt in range(2):
+            try:
+                # Send both writes in a single round trip unless batching is disabled
+                client = redis_conn.pipeline(transaction=False) if BATCH_REDIS else redis_conn
+                
+                # Cache for 5 minutes
+                client.setex(cache_key, 300, orjson.dumps(data))
+                
+                # Update the session summary server-side and cache it for 10 minutes
+                client.evalsha(get_session_summary_sha(redis_conn), 1, session_key, emotion, timestamp, 600)
+                
+                if BATCH_REDIS:
+                    client.execute()
+                break
+            except redis.exceptions.NoScriptError:
+                if attempt:
+                    raise
+                session_summary_sha = None
         
     except Exception as e:
         logger.error(f"Error caching engagement data: {e}")
@@ -344,25 +1114,19 @@ def get_session_summary(session_id):
     try:
         redis_conn = get_redis_connection()
         if redis_conn is None:
-            return jsonify({'error': 'Cache service unavailable'}), 503
+            return json_response({'error': 'Cache service unavailable'}, 503)
         
-        cache_key = f"session:{session_id}:summary"
-        session_data = redis_conn.get(cache_key)
+        session_data = redis_conn.get(session_summary_key(session_id))
         
         if session_data:
-            summary = json.loads(session_data)
-            return jsonify(summary)
+            # The cached value is already JSON, so pass it through without re-encoding
+            return Response(session_data, mimetype='application/json')
         else:
-            return jsonify({
-                'total_students': 0,
-                'emotions': {},
-                'average_engagement': 0.0,
-                'last_updated': datetime.now().isoformat()
-            })
+            return json_response(empty_session_summary())
         
     except Exception as e:
         logger.error(f"Error getting session summary: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return json_response({'error': 'Internal server error'}, 500)
 
 @app.route('/student_engagement/<int:session_id>/<int:student_id>', methods=['GET'])
 def get_student_engagement(session_id, student_id):
@@ -370,24 +1134,39 @@ def get_student_engagement(session_id, student_id):
     try:
         redis_conn = get_redis_connection()
         if redis_conn is None:
-            return jsonify({'error': 'Cache service unavailable'}), 503
+            return json_response({'error': 'Cache service unavailable'}, 503)
         
-        cache_key = f"engagement:session:{session_id}:student:{student_id}"
-        engagement_data = redis_conn.get(cache_key)
+        engagement_data = redis_conn.get(student_engagement_key(session_id, student_id))
         
         if engagement_data:
-            return jsonify(json.loads(engagement_data))
+            return Response(engagement_data, mimetype='application/json')
         else:
-            return jsonify({'error': 'No recent engagement data found'}), 404
+            return json_response({'error': 'No recent engagement data found'}, 404)
         
     except Exception as e:
         logger.error(f"Error getting student engagement: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return json_response({'error': 'Internal server error'}, 500)
 
-if __name__ == '__main__':
-    # Load models on startup
+def build_model_artifacts():
+    """Build the TensorRT engine or INT8 model once, ahead of the workers that load them"""
+    configure_tensorflow()
+    if not os.path.exists(MODEL_PATH):
+        return
+    model = tf.keras.models.load_model(MODEL_PATH)
+    if ensure_tensorrt_engine(model, MODEL_PATH) is None and not tf.config.list_physical_devices('GPU'):
+        ensure_tflite_model(model, MODEL_PATH)
+
+def init_service():
+    """Load models and start background workers for this process"""
+    configure_tensorflow()
     load_emotion_model()
-    load_face_cascade()
+    warmup_model()
+    start_batch_worker()
+    start_insert_flusher()
+
+if __name__ == '__main__':
+    # Load models on startup (under gunicorn this runs in each worker, see gunicorn.conf.py)
+    init_service()
     
     # Get port from environment
     port = int(os.getenv('PORT', 5001))
@@ -0,0 +1,90 @@
+"""ASGI entrypoint: async Redis-only endpoints in front of the Flask app"""
+import os
+import logging
+
+import orjson
+import redis.asyncio as aioredis
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+import app as ml_app
+
+logger = logging.getLogger(__name__)
+
+# Threads that run the blocking Flask routes (inference, database writes)
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', 4))
+
+redis_client = None
+
+def get_async_redis_connection():
+    """Get the shared asyncio Redis client for this worker's event loop"""
+    global redis_client
+    if redis_client is None:
+        redis_client = aioredis.Redis.from_url(
+            os.getenv('REDIS_URL', 'redis://localhost:6379'),
+            max_connections=ml_app.REDIS_MAX_CONNECTIONS,
+            socket_keepalive=True,
+            socket_timeout=ml_app.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=ml_app.REDIS_SOCKET_TIMEOUT
+        )
+    return redis_client
+
+def json_response(payload, status=200):
+    """Starlette counterpart of app.json_response"""
+    return Response(orjson.dumps(payload), status_code=status, media_type='application/json')
+
+async def get_session_summary(request):
+    """Get real-time session summary from cache"""
+    try:
+        session_key = ml_app.session_summary_key(request.path_params['session_id'])
+        session_data = await get_async_redis_connection().get(session_key)
+        
+        if session_data:
+            return Response(session_data, media_type='application/json')
+        else:
+            return json_response(ml_app.empty_session_summary())
+        
+    except aioredis.ConnectionError as e:
+        logger.error(f"Redis connection error: {e}")
+        return json_response({'error': 'Cache service unavailable'}, 503)
+    except Exception as e:
+        logger.error(f"Error getting session summary: {e}")
+        return json_response({'error': 'Internal server error'}, 500)
+
+async def get_student_engagement(request):
+    """Get recent engagement data for a specific student"""
+    try:
+        cache_key = ml_app.student_engagement_key(request.path_params['session_id'], request.path_params['student_id'])
+        engagement_data = await get_async_redis_connection().get(cache_key)
+        
+        if engagement_data:
+            return Response(engagement_data, media_type='application/json')
+        else:
+            return json_response({'error': 'No recent engagement data found'}, 404)
+        
+    except aioredis.ConnectionError as e:
+        logger.error(f"Redis connection error: {e}")
+        return json_response({'error': 'Cache service unavailable'}, 503)
+    except Exception as e:
+        logger.error(f"Error getting student engagement: {e}")
+        return json_response({'error': 'Internal server error'}, 500)
+
+# Redis-only reads are served on the event loop; everything else goes to Flask in a thread pool
+application = Starlette(
+    routes=[
+        Route('/session_summary/{session_id:int}', get_session_summary, methods=['GET']),
+        Route('/student_engagement/{session_id:int}/{student_id:int}', get_student_engagement, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(ml_app.app, workers=WSGI_THREADS))
+    ],
+    # Same policy as flask-cors' CORS(app) defaults: any origin, echoed back, without credentials
+    middleware=[Middleware(
+        CORSMiddleware,
+        allow_origin_regex='.*',
+        allow_methods=['GET', 'HEAD', 'POST', 'OPTIONS', 'PUT', 'PATCH', 'DELETE'],
+        allow_headers=['*']
+    )]
+)
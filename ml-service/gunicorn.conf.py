@@ -0,0 +1,73 @@
+"""Gunicorn configuration for the ML service"""
+import math
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5001)}"
+# Async workers for the ASGI entrypoint (asgi.py); Flask routes run in a per-worker thread pool
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+# One process per core on CPU deployments. On GPU deployments set GUNICORN_WORKERS=1
+# so a single worker (and its batching scheduler) owns the GPU instead of N workers
+# competing for VRAM.
+workers = int(os.getenv('GUNICORN_WORKERS', cpu_count))
+# Size of the thread pool that runs the Flask routes inside each worker
+os.environ.setdefault('WSGI_THREADS', os.getenv('GUNICORN_THREADS', '4'))
+
+# Request timeout; model loading and warmup are bounded by boot_timeout instead
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+boot_timeout = int(os.getenv('GUNICORN_BOOT_TIMEOUT', 600))
+
+# Split the cores between workers so their TensorFlow thread pools don't oversubscribe
+threads_per_worker = str(max(1, math.ceil(cpu_count / workers)))
+os.environ.setdefault('OMP_NUM_THREADS', threads_per_worker)
+os.environ.setdefault('TF_NUM_INTRAOP_THREADS', threads_per_worker)
+os.environ.setdefault('TF_FORCE_GPU_ALLOW_GROWTH', 'true')
+
+def on_starting(server):
+    """Build the TensorRT engine or INT8 model once before any worker boots"""
+    # Run in a child process so the master never initializes TensorFlow or CUDA before forking
+    result = subprocess.run(
+        [sys.executable, '-c', 'import app; app.build_model_artifacts()'],
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        server.log.warning(f"Model artifact build exited with {result.returncode}")
+
+def post_worker_init(worker):
+    """Load the model and start background threads in each worker process"""
+    import app
+    
+    errors = []
+    def boot():
+        try:
+            app.init_service()
+        except BaseException as e:
+            errors.append(e)
+    
+    # Keep heartbeating while the model loads and warms up, so boot time never counts
+    # against the request timeout and a slow start doesn't get the worker killed and respawned
+    boot_thread = threading.Thread(target=boot, daemon=True)
+    boot_thread.start()
+    deadline = time.monotonic() + boot_timeout
+    while boot_thread.is_alive():
+        worker.notify()
+        if time.monotonic() > deadline:
+            worker.log.error(f"Worker did not finish loading the model within {boot_timeout}s")
+            # WORKER_BOOT_ERROR makes the master shut down instead of respawning workers in a loop
+            sys.exit(3)
+        boot_thread.join(min(1.0, timeout / 2))
+    
+    if errors:
+        raise errors[0]
+
+def worker_exit(server, worker):
+    """Write out buffered engagement rows before the worker goes away"""
+    import app
+    app.flush_engagement_data()
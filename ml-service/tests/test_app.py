@@ -0,0 +1,151 @@
+import base64
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+import psycopg2
+
+import app
+
+
+def encode_image(image, ext='.png'):
+    ok, buffer = cv2.imencode(ext, image)
+    assert ok
+    return base64.b64encode(buffer.tobytes()).decode()
+
+
+def test_vectorized_scores_match_scalar_scores():
+    confidences = np.array([0.0, 0.25, 0.5, 0.82, 0.9, 1.0], dtype=np.float32)
+    emotion_idx = np.repeat(np.arange(app.NUM_EMOTIONS), len(confidences))
+    confidence = np.tile(confidences, app.NUM_EMOTIONS)
+
+    vectorized = app.calculate_engagement_scores_vec(emotion_idx, confidence)
+    expected = [
+        app.calculate_engagement_score(app.emotion_labels[idx], float(conf))
+        for idx, conf in zip(emotion_idx, confidence)
+    ]
+
+    assert vectorized.dtype == np.float64
+    assert [float(score) for score in vectorized] == expected
+
+
+def test_batch_results_keep_order_with_failed_images():
+    client = app.app.test_client()
+    valid_image = encode_image(np.full((96, 96), 128, np.uint8))
+    images = [
+        valid_image,
+        base64.b64encode(b'not an image').decode(),
+        valid_image,
+        'not base64 at all!',
+        valid_image
+    ]
+
+    response = client.post('/detect_emotion_batch', json={'images': images})
+
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['index'] for result in results] == list(range(len(images)))
+    for i in (1, 3):
+        assert results[i]['error'] == 'Failed to process image'
+    for i in (0, 2, 4):
+        assert results[i]['emotion'] in app.emotion_labels
+        assert 0.0 <= results[i]['engagement_score'] <= 1.0
+
+
+def test_jpeg_dimensions_read_from_header():
+    image = np.zeros((100, 260), dtype=np.uint8)
+    for params in ([], [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]):
+        _, buffer = cv2.imencode('.jpg', image, params)
+        assert app.jpeg_dimensions(buffer.tobytes()) == (260, 100)
+        assert app.decode_image_bytes(buffer.tobytes()).shape == (48, 48)
+
+    _, buffer = cv2.imencode('.png', image)
+    assert app.jpeg_dimensions(buffer.tobytes()) is None
+
+
+def test_parse_id_rejects_malformed_ids():
+    assert app.parse_id(7) == 7
+    assert app.parse_id('42') == 42
+    for value in ('\u00b2', '', 'abc', '1.5', -3, 0, True, None, 1.0, [1]):
+        assert app.parse_id(value) is None
+
+
+class FakeCursor:
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.log.append(sql)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.log = []
+
+    def cursor(self):
+        return FakeCursor(self.log)
+
+    def commit(self):
+        self.log.append('COMMIT')
+
+    def rollback(self):
+        self.log.append('ROLLBACK')
+
+
+def test_flush_drops_only_the_failing_row(monkeypatch):
+    conn = FakeConnection()
+    inserted = []
+
+    @contextmanager
+    def fake_connection():
+        yield conn
+
+    def fake_execute_values(cursor, sql, rows, page_size=100):
+        # Session 99 stands in for a row that violates a foreign key
+        if any(row[0] == 99 for row in rows):
+            raise psycopg2.IntegrityError('violates foreign key constraint')
+        inserted.extend(rows)
+
+    monkeypatch.setattr(app, 'get_database_connection', fake_connection)
+    monkeypatch.setattr(app, 'execute_values', fake_execute_values)
+    monkeypatch.setattr(app, 'insert_flusher', object())
+    monkeypatch.setattr(app, 'insert_buffer', app.collections.deque())
+
+    for session_id in (1, '2', 99, '\u00b2', 3):
+        app.store_engagement_data(session_id, 5, 'happy', 0.9, 0.8, '2024-01-01T00:00:00Z')
+    app.flush_engagement_data()
+
+    assert [row[0] for row in inserted] == [1, 2, 3]
+    assert conn.log[0] == 'ROLLBACK'
+    assert conn.log.count('ROLLBACK TO SAVEPOINT engagement_row') == 1
+    assert conn.log[-1] == 'COMMIT'
+
+
+def test_repeated_frame_from_same_student_is_a_cache_hit(monkeypatch):
+    calls = []
+
+    def fake_detect(processed_image):
+        calls.append(processed_image)
+        return 'happy', 0.9, 0.86
+
+    monkeypatch.setattr(app, 'detect_emotion_batched', fake_detect)
+    monkeypatch.setattr(app, 'store_engagement_data', lambda *args: None)
+    monkeypatch.setattr(app, 'cache_engagement_data', lambda *args: None)
+    monkeypatch.setattr(app, 'frame_cache', app.collections.OrderedDict())
+
+    client = app.app.test_client()
+    image = cv2.imencode('.png', np.full((96, 96), 128, np.uint8))[1].tobytes()
+    for _ in range(2):
+        response = client.post(
+            '/detect_emotion?session_id=1&student_id=2', data=image, content_type='image/png'
+        )
+        assert response.status_code == 200
+        assert response.get_json()['emotion'] == 'happy'
+
+    assert len(calls) == 1
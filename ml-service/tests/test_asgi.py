@@ -0,0 +1,39 @@
+from starlette.testclient import TestClient
+
+import asgi
+
+
+class FakeAsyncRedis:
+    def __init__(self, values):
+        self.values = values
+
+    async def get(self, key):
+        return self.values.get(key)
+
+
+def test_redis_endpoints_run_async_and_other_routes_reach_flask(monkeypatch):
+    cached = b'{"emotion":"happy","confidence":0.9}'
+    monkeypatch.setattr(asgi, 'redis_client', FakeAsyncRedis({'engagement:session:1:student:2': cached}))
+    client = TestClient(asgi.application)
+
+    response = client.get('/student_engagement/1/2')
+    assert response.status_code == 200
+    assert response.content == cached
+
+    assert client.get('/student_engagement/1/3').status_code == 404
+    assert client.get('/session_summary/1').json()['total_students'] == 0
+    assert client.get('/health').status_code == 200
+
+
+def test_async_routes_send_the_same_cors_headers_as_flask(monkeypatch):
+    monkeypatch.setattr(asgi, 'redis_client', FakeAsyncRedis({}))
+    client = TestClient(asgi.application)
+    origin = {'Origin': 'http://localhost:3000'}
+
+    for path in ('/health', '/session_summary/1', '/student_engagement/1/2'):
+        response = client.get(path, headers=origin)
+        assert response.headers.get_list('access-control-allow-origin') == ['http://localhost:3000']
+
+    preflight = client.options('/session_summary/1', headers={**origin, 'Access-Control-Request-Method': 'GET'})
+    assert preflight.status_code == 200
+    assert preflight.headers['access-control-allow-origin'] == 'http://localhost:3000'